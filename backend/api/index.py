@@ -1,20 +1,35 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, jsonify
 from flask_cors import CORS
+from werkzeug.utils import import_string
 import os
-import logging
-import time
-import json
 import sys
 
 # Add the parent directory to the path so we can import from app.py
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Import the Flask app from app.py
-from app import app as flask_app
+# Slim app for health checks, so they never pay for importing app.py
+health_app = Flask(__name__)
+CORS(health_app)
 
-def handler(request):
+@health_app.route('/api/health', methods=['GET'])
+def health_check():
+    """API health check endpoint"""
+    return jsonify({"status": "healthy"})
+
+_flask_app = None
+
+def get_flask_app():
+    """Import the main Flask app from app.py on the first non-health request"""
+    global _flask_app
+    if _flask_app is None:
+        _flask_app = import_string("app:app")
+    return _flask_app
+
+def handler(environ, start_response):
     """Serverless function handler for Vercel"""
-    return flask_app(request)
+    if environ.get("PATH_INFO", "").rstrip("/") == "/api/health":
+        return health_app(environ, start_response)
+    return get_flask_app()(environ, start_response)
 
 # Export the handler for Vercel serverless functions
 app = handler
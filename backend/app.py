@@ -1,153 +1,719 @@
-from flask import Flask, request, jsonify
+from __future__ import annotations
+
+from flask import Flask, request, Response
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+from flask_caching import Cache
 import os
 import logging
 import time
-import json
-from crewai import Agent, Task, Crew, Process
-import arxiv
-from typing import List, Dict
-from datetime import datetime
+import orjson
+import asyncio
+import atexit
+import concurrent.futures
+import random
+import weakref
+import functools
+import hashlib
+import contextvars
+import re
+import string
+import unicodedata
+import uuid
+from collections import deque
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache
+import xxhash
+from typing import TYPE_CHECKING, List, Dict, Optional
 import threading
 
+# crewai, aiohttp and uvloop are imported on first use (crewai is preloaded
+# under gunicorn, below): they dominate cold-start time and status/health
+# requests never need them
+if TYPE_CHECKING:
+    import aiohttp
+    from crewai import Agent, Task
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Under gunicorn --preload the master imports crewai once, so forked
+# workers share it copy-on-write instead of each paying on its first run
+if os.environ.get("SERVER_SOFTWARE", "").startswith("gunicorn"):
+    try:
+        import crewai  # noqa: F401
+        import langchain_openai  # noqa: F401
+    except ImportError as e:
+        logger.warning(f"Could not preload crewai: {e}")
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, option=ORJSON_OPTIONS, default=str).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+def jsonify_fast(obj, status: int = 200) -> Response:
+    """Serialize a JSON response with orjson, skipping Flask's provider"""
+    return Response(
+        orjson.dumps(obj, option=ORJSON_OPTIONS, default=str),
+        status=status,
+        mimetype="application/json"
+    )
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)  # flask.jsonify in third-party code paths
 CORS(app)  # Enable CORS for all routes
 
-# Store ongoing research processes and results
-research_processes = {}
-research_results = {}
-research_logs = {}
+# Store ongoing research processes, results and logs in a shared cache so
+# any worker (or cold serverless instance) can answer status requests
+SESSION_TTL = 24 * 60 * 60
+LOG_BUFFER_SIZE = 500
+SSE_KEEPALIVE = 15  # seconds between keepalive comments on idle streams
+
+# Every open log stream pins a server thread, so cap them below the
+# gunicorn thread count (see Procfile) to keep threads free for polls
+MAX_LOG_STREAMS = int(os.environ.get("MAX_LOG_STREAMS", "4"))
+_open_log_streams = threading.BoundedSemaphore(MAX_LOG_STREAMS)
+
+cache_config = {"CACHE_DEFAULT_TIMEOUT": SESSION_TTL}
+if os.environ.get("REDIS_URL"):
+    cache_config["CACHE_TYPE"] = "RedisCache"
+    cache_config["CACHE_REDIS_URL"] = os.environ["REDIS_URL"]
+else:
+    # Per-process caches can't share sessions between gunicorn workers
+    if int(os.environ.get("WEB_CONCURRENCY", "1")) > 1:
+        logger.warning("REDIS_URL is not set; with WEB_CONCURRENCY > 1 each worker "
+                       "only sees its own research sessions")
+    # Single-process fallback for local development; log entries are
+    # stored one key each, so leave room for several full buffers
+    cache_config["CACHE_TYPE"] = "SimpleCache"
+    cache_config["CACHE_THRESHOLD"] = 20000
+cache = Cache(app, config=cache_config)
+
+# Literature search results shared by all sessions in this process, keyed
+# by (SerpAPI key digest, query hash): results with and without web hits,
+# and web hits paid for by different keys, never mix
+search_cache = TTLCache(maxsize=1024, ttl=3600)
+
+# (ETag, results) of past SerpAPI responses, keyed like search_cache; outlives
+# it so expired queries can be revalidated with If-None-Match instead of refetched
+web_validators = TTLCache(maxsize=1024, ttl=SESSION_TTL)
+
+# Session the current research task belongs to; set per worker task and
+# inherited by the crew thread, so cached tools can be shared safely
+current_session_id: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "current_session_id", default="default"
+)
+
+def session_key(session_id: str, field: str) -> str:
+    """Cache key for one field (status, result, logs) of a research session"""
+    return f"research:{session_id}:{field}"
+
+def get_session_value(session_id: str, field: str, default=None):
+    """Read a JSON-serialized session field from the shared cache"""
+    raw = cache.get(session_key(session_id, field))
+    return default if raw is None else orjson.loads(raw)
+
+def set_session_value(session_id: str, field: str, value):
+    """Store a session field in the shared cache as JSON"""
+    cache.set(session_key(session_id, field), orjson.dumps(value, default=str))
+
+def get_session_logs(session_id: str, since: int, log_count: int) -> List[Dict]:
+    """Read stored log entries from index `since`, within the last LOG_BUFFER_SIZE"""
+    first = max(since, log_count - LOG_BUFFER_SIZE, 0)
+    keys = [session_key(session_id, f"log:{index}") for index in range(first, log_count)]
+    if not keys:
+        return []
+    return [orjson.loads(raw) for raw in cache.get_many(*keys) if raw is not None]
+
+class SessionLog:
+    """Bounded log buffer for one running session, with live stream subscribers"""
+    
+    def __init__(self, session_id: str, maxlen: int = LOG_BUFFER_SIZE):
+        self.session_id = session_id
+        self.entries = deque(maxlen=maxlen)
+        self.total = 0  # entries ever logged, so clients can resume with ?since=
+        self.subscribers = set()
+        self.lock = asyncio.Lock()
+    
+    async def append(self, log_entry: Dict):
+        """Record an entry, push it to subscribers and mirror it to the cache"""
+        async with self.lock:
+            index = self.total
+            self.entries.append(log_entry)
+            self.total += 1
+            for queue in self.subscribers:
+                queue.put_nowait(log_entry)
+            
+            # The shared cache may be Redis, so write it off the event loop
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.mirror, index, log_entry)
+    
+    def mirror(self, index: int, log_entry: Dict):
+        """Store one entry for status polls from any worker, dropping the one
+        that fell out of the buffer, so each append costs O(1) cache writes"""
+        cache.set_many({
+            session_key(self.session_id, f"log:{index}"): orjson.dumps(log_entry, default=str),
+            session_key(self.session_id, "log_count"): orjson.dumps(index + 1)
+        })
+        if index >= self.entries.maxlen:
+            cache.delete(session_key(self.session_id, f"log:{index - self.entries.maxlen}"))
+    
+    def subscribe(self, since: int = 0) -> asyncio.Queue:
+        """Open a stream queue, pre-filled with buffered entries from index `since`"""
+        queue = asyncio.Queue()
+        first = self.total - len(self.entries)
+        for log_entry in list(self.entries)[max(0, since - first):]:
+            queue.put_nowait(log_entry)
+        self.subscribers.add(queue)
+        return queue
+    
+    def close(self):
+        """End all open streams"""
+        for queue in self.subscribers:
+            queue.put_nowait(None)
+        self.subscribers.clear()
+
+# Logs of sessions running in this process; only touched on the research loop
+session_logs: Dict[str, SessionLog] = {}
+
+def format_log_entry(log_entry: Dict) -> Dict:
+    """Copy of a log entry with its nanosecond timestamp rendered for clients"""
+    formatted = dict(log_entry)
+    ts_ns = formatted.pop("ts_ns", None)
+    if ts_ns is not None:
+        formatted["timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(ts_ns // 1_000_000_000))
+    return formatted
+
+async def append_session_log(session_id: str, log_entry: Dict):
+    """Append an entry to the logs of a running session"""
+    session_log = session_logs.get(session_id)
+    if session_log is not None:
+        await session_log.append(log_entry)
+
+async def subscribe_session_log(session_id: str, since: int) -> Optional[asyncio.Queue]:
+    """Open a log stream for a session running in this process"""
+    session_log = session_logs.get(session_id)
+    return None if session_log is None else session_log.subscribe(since)
+
+def unsubscribe_session_log(session_id: str, queue: asyncio.Queue):
+    """Close a log stream opened with subscribe_session_log"""
+    session_log = session_logs.get(session_id)
+    if session_log is not None:
+        session_log.subscribers.discard(queue)
+
+async def next_log_entry(queue: asyncio.Queue, timeout: float):
+    """Wait for the next streamed entry; returns {} when the stream is idle"""
+    try:
+        return await asyncio.wait_for(queue.get(), timeout)
+    except asyncio.TimeoutError:
+        return {}
+
+ARXIV_API_URL = "http://export.arxiv.org/api/query"
+SERPAPI_URL = "https://serpapi.com/search.json"
+
+# Token buckets sized to each provider's published limits: arXiv asks for
+# at most one request every three seconds, SerpAPI allows short bursts
+_arxiv_limiter = AsyncLimiter(1, 3)
+_serpapi_limiter = AsyncLimiter(5, 1)
+
+# Retry settings for throttled (429/503) responses
+MAX_RETRIES = 4
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# Crew runs block on LLM calls, so they get a bounded thread pool; sessions
+# beyond MAX_PENDING_RESEARCH (running or queued) are turned away with 503
+RESEARCH_WORKERS = int(os.environ.get("RESEARCH_WORKERS", "8"))
+MAX_PENDING_RESEARCH = int(os.environ.get("MAX_PENDING_RESEARCH", "64"))
+
+EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=RESEARCH_WORKERS,
+    thread_name_prefix="research-crew"
+)
+atexit.register(EXECUTOR.shutdown, wait=True, cancel_futures=True)
+_pending_research = threading.BoundedSemaphore(MAX_PENDING_RESEARCH)
+
+# Background event loop that runs research workers and literature searches
+_research_loop = None
+_research_loop_lock = threading.Lock()
+_http_session = None
+HTTP_POOL_SIZE = 20
+HTTP_KEEPALIVE = 60  # seconds an idle pooled connection stays open
+
+def get_research_loop() -> asyncio.AbstractEventLoop:
+    """Return the background event loop, starting it on first use"""
+    global _research_loop
+    with _research_loop_lock:
+        if _research_loop is None:
+            try:
+                import uvloop
+                _research_loop = uvloop.new_event_loop()
+            except ImportError:  # uvloop is not available on Windows
+                _research_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_research_loop.run_forever,
+                name="research-loop",
+                daemon=True
+            ).start()
+    return _research_loop
+
+def run_coroutine(coro) -> concurrent.futures.Future:
+    """Schedule a coroutine on the background event loop from any thread"""
+    return asyncio.run_coroutine_threadsafe(coro, get_research_loop())
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """Return the HTTP session shared by all searches on the research loop"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        import aiohttp
+        # One keep-alive pool for the whole process, so repeated arXiv and
+        # SerpAPI queries reuse open connections instead of reconnecting
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE,
+            keepalive_timeout=HTTP_KEEPALIVE,
+            ttl_dns_cache=300
+        )
+        _http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+    return _http_session
+
+def close_http_session():
+    """Close the shared HTTP session and its pooled connections"""
+    if _http_session is not None and not _http_session.closed:
+        run_coroutine(_http_session.close()).result(timeout=5)
+
+atexit.register(close_http_session)
+
+@dataclass
+class RateLimitState:
+    """Per-session provider backoff"""
+    serpapi_resume_at: float = 0.0  # time.monotonic() deadline set by SerpAPI headers
+
+# Held alive by the search tools of each running session
+_rate_limit_states = weakref.WeakValueDictionary()
+
+def get_rate_limit_state(session_id: str) -> RateLimitState:
+    """Return the rate limit state shared by all tools of a session"""
+    state = _rate_limit_states.get(session_id)
+    if state is None:
+        state = RateLimitState()
+        _rate_limit_states[session_id] = state
+    return state
+
+def retry_delay(headers, attempt: int) -> float:
+    """Seconds to wait before retrying, honoring Retry-After when sent"""
+    retry_after = headers.get("Retry-After", "")
+    if retry_after.isdigit():
+        return float(retry_after)
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+async def read_body(response) -> bytes:
+    """Read a whole response body"""
+    return await response.read()
+
+async def fetch_with_backoff(limiter: AsyncLimiter, url: str, params: Dict,
+                             headers: Optional[Dict] = None, reader=read_body):
+    """GET a URL through a token bucket, backing off on throttled responses"""
+    session = await get_http_session()
+    for attempt in range(MAX_RETRIES + 1):
+        async with limiter:
+            async with session.get(url, params=params, headers=headers) as response:
+                if response.status not in (429, 503) or attempt == MAX_RETRIES:
+                    response.raise_for_status()
+                    return response.status, response.headers, await reader(response)
+                delay = retry_delay(response.headers, attempt)
+        logger.warning(f"Throttled by {url} (HTTP {response.status}), retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+# Punctuation and whitespace between query words; "+" and "#" stay so
+# "C++", "C#" and "C" are different queries
+_query_separators = re.compile(r"[^\w+#]+|_+")
+
+ATOM = "{http://www.w3.org/2005/Atom}"
+ARXIV_CHUNK_SIZE = 16 * 1024
+
+def paper_from_entry(entry: ET.Element) -> Dict:
+    """Build a paper dict from an Atom <entry> element"""
+    published = entry.findtext(f"{ATOM}published")
+    return {
+        "title": " ".join(entry.findtext(f"{ATOM}title", "").split()),
+        "authors": [author.findtext(f"{ATOM}name") for author in entry.iterfind(f"{ATOM}author")],
+        "summary": entry.findtext(f"{ATOM}summary", "").strip(),
+        "pdf_url": next(
+            (link.get("href") for link in entry.iterfind(f"{ATOM}link") if link.get("title") == "pdf"),
+            None
+        ),
+        "published": published[:10] if published else None
+    }
+
+async def iter_arxiv_atom(chunks):
+    """Yield paper dicts from an arXiv Atom feed as its bytes arrive"""
+    parser = ET.XMLPullParser(events=("end",))
+    async for chunk in chunks:
+        parser.feed(chunk)
+        for _, element in parser.read_events():
+            if element.tag == f"{ATOM}entry":
+                yield paper_from_entry(element)
+                # Drop the parsed entry so memory stays flat across the feed
+                element.clear()
+    parser.close()
+
+async def read_arxiv_papers(response) -> List[Dict]:
+    """Parse an arXiv response incrementally instead of buffering the body"""
+    chunks = response.content.iter_chunked(ARXIV_CHUNK_SIZE)
+    return [paper async for paper in iter_arxiv_atom(chunks)]
+
+def key_hash(api_key: Optional[str]) -> str:
+    """Short digest of an API key, used to key caches without storing the key"""
+    if not api_key:
+        return ""
+    return hashlib.blake2b(api_key.encode()).hexdigest()[:16]
 
 class EnhancedSearchTool:
     """Search tool with multiple backends and caching"""
     
+    # Fixed attributes; per-session state lives in RateLimitState
+    __slots__ = ("api_keys", "cache", "key_scope", "name", "description")
+    
     def __init__(self, api_keys: Dict[str, str]):
         self.api_keys = api_keys
-        self.cache = {}
+        self.cache = search_cache
+        self.key_scope = key_hash(api_keys.get("serpapi"))
         self.name = "enhanced_literature_search"
         self.description = "Search scientific literature across multiple sources"
-        self.last_query_time = 0
-        self.query_count = 0
-        self.max_queries_per_session = 20
     
     def func(self, query: str) -> Dict:
         """Search with caching and rate limiting"""
-        # Log the search query
-        logger.info(f"Searching for: {query}")
-        
-        # Add to logs
-        session_id = getattr(self, 'session_id', 'default')
-        if session_id in research_logs:
-            research_logs[session_id].append({
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        # Agents call tools synchronously from the crew thread, so hand the
+        # search over to the research loop and wait for it there
+        return run_coroutine(self.asearch(query, current_session_id.get())).result()
+    
+    async def asearch(self, query: str, session_id: Optional[str] = None) -> Dict:
+        """Search with caching and rate limiting without blocking the loop"""
+        results = await self.search_many([query], session_id)
+        return results[query]
+    
+    async def search_many(self, queries: List[str], session_id: Optional[str] = None) -> Dict[str, Dict]:
+        """Search several queries concurrently, skipping cached ones"""
+        if session_id is None:
+            session_id = current_session_id.get()
+        rate_state = get_rate_limit_state(session_id)
+        results = {}
+        keys = {query: self.scoped_key(query) for query in queries}
+        misses = {}  # cache key -> query to fetch, so duplicates hit the network once
+        
+        for query, key in keys.items():
+            # Log the search query
+            logger.info(f"Searching for: {query}")
+            
+            # Add to logs
+            await append_session_log(session_id, {
+                "ts_ns": time.time_ns(),
                 "agent": "Search Tool",
                 "action": "Searching",
                 "result": f"Query: {query}"
             })
+            
+            # Check cache
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.info(f"Cache hit for: {query}")
+                results[query] = cached
+            elif key not in misses:
+                misses[key] = query
         
-        # Check cache
-        cache_key = query.lower().strip()
-        if cache_key in self.cache:
-            logger.info(f"Cache hit for: {query}")
-            return self.cache[cache_key]
-        
-        # Rate limiting
-        current_time = time.time()
-        if hasattr(self, 'last_query_time') and current_time - self.last_query_time < 2:
-            time.sleep(2 - (current_time - self.last_query_time))
+        # Fan the misses out together; the token buckets still pace the requests
+        fetched = dict(zip(misses, await asyncio.gather(
+            *(self._fetch_one(query, rate_state) for query in misses.values())
+        )))
         
-        # Check query limits
-        self.query_count = getattr(self, 'query_count', 0) + 1
-        if self.query_count > self.max_queries_per_session:
-            logger.warning("Maximum query limit reached")
-            return {"error": "Query limit reached", "results": {"arxiv": [], "web": []}}
+        # Cache results
+        self.cache.update(fetched)
+        for query, key in keys.items():
+            if query not in results:
+                results[query] = fetched[key]
         
+        return results
+    
+    @staticmethod
+    def cache_key(query: str) -> int:
+        """Hash a normalized query into its search cache key"""
+        # Drop accents, case and punctuation so "GPT-4", "gpt  4" and "GPT 4"
+        # share one cache entry (and one arXiv request). Only marks on Latin
+        # letters are dropped; other scripts keep every character
+        chars = []
+        for char in unicodedata.normalize("NFKD", query.casefold()):
+            if unicodedata.combining(char) and chars and chars[-1].isascii():
+                continue
+            chars.append(char)
+        normalized = _query_separators.sub(" ", "".join(chars)).strip()
+        # Queries made only of punctuation still get a key of their own
+        return xxhash.xxh3_64_intdigest((normalized or query.casefold()).encode())
+    
+    def scoped_key(self, query: str) -> tuple:
+        """Key of a query in search_cache and web_validators for this tool's SerpAPI key"""
+        return self.key_scope, self.cache_key(query)
+    
+    async def _fetch_one(self, query: str, rate_state: RateLimitState) -> Dict:
+        """Search all backends for a query that is not cached"""
+        # Rate limiting is handled per provider by the token buckets
         results = {
             "arxiv": [],
             "web": []
         }
         
-        # Always try arXiv first - it's free and doesn't need an API key
-        try:
-            # arXiv search
-            search = arxiv.Search(
-                query=query,
-                max_results=5,
-                sort_by=arxiv.SortCriterion.Relevance
-            )
-            results["arxiv"] = [
-                {
-                    "title": result.title,
-                    "authors": [str(author) for author in result.authors],
-                    "summary": result.summary,
-                    "pdf_url": result.pdf_url,
-                    "published": result.published.strftime("%Y-%m-%d") if hasattr(result, "published") else None
-                }
-                for result in search.results()
-            ]
-        except Exception as e:
-            logger.error(f"Error in arXiv search: {str(e)}")
+        # A query with a stored ETag only costs a cheap revalidation, so start
+        # it alongside arXiv; otherwise SerpAPI waits until arXiv falls short
+        web_search = None
+        if self.api_keys.get("serpapi") and self.scoped_key(query) in web_validators:
+            web_search = asyncio.ensure_future(self._search_web(query, rate_state))
         
-        # Only use SerpAPI if we don't have enough results from arXiv
-        if len(results["arxiv"]) < 3 and "serpapi" in self.api_keys and self.api_keys["serpapi"]:
+        try:
+            # arXiv is free and doesn't need an API key
             try:
-                from serpapi import GoogleSearch
-                
-                # Web search using SerpAPI
-                web_search = GoogleSearch({
-                    "q": query,
-                    "api_key": self.api_keys["serpapi"],
-                    "num": 3  # Reduce the number to save API calls
-                })
-                results["web"] = web_search.get_dict().get("organic_results", [])
+                results["arxiv"] = await self._search_arxiv(query)
             except Exception as e:
-                logger.error(f"Error in web search: {str(e)}")
-        
-        # Cache results
-        self.cache[cache_key] = results
-        self.last_query_time = time.time()
+                logger.error(f"Error in arXiv search: {str(e)}")
+            
+            # Only use SerpAPI if we don't have enough results from arXiv
+            if len(results["arxiv"]) >= 3:
+                if web_search is not None:
+                    web_search.cancel()
+            elif self.api_keys.get("serpapi"):
+                if web_search is None:
+                    web_search = asyncio.ensure_future(self._search_web(query, rate_state))
+                (web_results,) = await asyncio.gather(web_search, return_exceptions=True)
+                if isinstance(web_results, BaseException):
+                    logger.error(f"Error in web search: {str(web_results)}")
+                else:
+                    results["web"] = web_results
+        finally:
+            if web_search is not None and not web_search.done():
+                web_search.cancel()
         
         return results
+    
+    async def _search_arxiv(self, query: str) -> List[Dict]:
+        """Query the arXiv Atom API"""
+        params = {
+            "search_query": query,
+            "max_results": 5,
+            "sortBy": "relevance"
+        }
+        _, _, papers = await fetch_with_backoff(
+            _arxiv_limiter, ARXIV_API_URL, params, reader=read_arxiv_papers
+        )
+        return papers
+    
+    async def _search_web(self, query: str, rate_state: RateLimitState) -> List[Dict]:
+        """Query Google through SerpAPI"""
+        # Respect a pause requested by earlier SerpAPI rate limit headers
+        wait = rate_state.serpapi_resume_at - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        
+        params = {
+            "engine": "google",
+            "q": query,
+            "api_key": self.api_keys["serpapi"],
+            "num": 3  # Reduce the number to save API calls
+        }
+        
+        # Revalidate a previous response so an unchanged result skips the body
+        key = self.scoped_key(query)
+        validator = web_validators.get(key)
+        request_headers = {"If-None-Match": validator[0]} if validator else None
+        
+        status, headers, body = await fetch_with_backoff(
+            _serpapi_limiter, SERPAPI_URL, params, request_headers
+        )
+        
+        # Shrink our budget as soon as SerpAPI reports it is exhausted
+        if headers.get("X-RateLimit-Remaining") == "0":
+            rate_state.serpapi_resume_at = time.monotonic() + retry_delay(headers, MAX_RETRIES)
+        
+        if status == 304 and validator:
+            return validator[1]
+        
+        web_results = orjson.loads(body).get("organic_results", [])
+        if headers.get("ETag"):
+            web_validators[key] = (headers["ETag"], web_results)
+        return web_results
+
+class BatchSearchTool:
+    """Expose EnhancedSearchTool.search_many to agents as a single tool call"""
+    
+    __slots__ = ("search_tool", "name", "description")
+    
+    def __init__(self, search_tool: EnhancedSearchTool):
+        self.search_tool = search_tool
+        self.name = "batch_literature_search"
+        self.description = ("Search scientific literature for several queries at once. "
+                            "Put one query per line.")
+    
+    def func(self, queries: str) -> Dict[str, Dict]:
+        """Run all queries in one concurrent sweep"""
+        query_list = [query.strip() for query in queries.splitlines() if query.strip()]
+        return run_coroutine(self.search_tool.search_many(query_list, current_session_id.get())).result()
+
+OPENAI_MODEL_NAME = os.environ.get("OPENAI_MODEL_NAME", "gpt-4o-mini")
+
+# LLM requests per minute allowed for each OpenAI key, shared by every crew
+# in the process (CrewAI's own max_rpm only counts within a single crew).
+# Crew memory stays off: CrewAI keeps it in one store per process, so
+# sessions would reset each other's short-term memory and read other users'
+# goals from long-term and entity memory
+CREW_RPM = int(os.environ.get("CREW_RPM", "30"))
+
+class RequestPacer:
+    """Thread-safe limiter that spaces blocking calls evenly to a rate per minute"""
+    
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / per_minute
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+    
+    def wait(self):
+        """Block the calling thread until its request slot comes up"""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_at)
+            self.next_at = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+@functools.lru_cache(maxsize=32)
+def openai_pacer(openai_key_hash: str) -> RequestPacer:
+    """The pacer shared by every crew that calls OpenAI with one key"""
+    return RequestPacer(CREW_RPM)
+
+@functools.lru_cache(maxsize=None)
+def _pacing_handler_class():
+    """LangChain callback that waits on a RequestPacer before each LLM call"""
+    from langchain_core.callbacks import BaseCallbackHandler
+    
+    class PacingHandler(BaseCallbackHandler):
+        # Sync callbacks run in the crew thread making the call, so the wait delays it
+        def __init__(self, pacer: RequestPacer):
+            self.pacer = pacer
+        
+        def on_llm_start(self, serialized, prompts, **kwargs):
+            self.pacer.wait()
+        
+        def on_chat_model_start(self, serialized, messages, **kwargs):
+            self.pacer.wait()
+    
+    return PacingHandler
+
+# API keys of the session running in the current context. Keys are never
+# written to os.environ, which is shared by every concurrent session; they
+# also reach _build_crew_resources this way so its LRU cache is keyed by
+# digests only
+openai_api_key_var: contextvars.ContextVar[str] = contextvars.ContextVar("openai_api_key")
+serpapi_key_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "serpapi_key", default=None
+)
+
+@functools.lru_cache(maxsize=32)
+def _build_crew_resources(openai_key_hash: str, serpapi_key_hash: str):
+    """Build the LLM client and search tool once per API key pair.
+    
+    Agents are not cached: Crew.kickoff() and Agent.execute_task() rebind
+    their crew, executor and RPM controller, so concurrent runs sharing one
+    Agent would trample each other. Agents get the client through agent_llm().
+    """
+    from langchain_openai import ChatOpenAI
+    
+    llm = ChatOpenAI(model=OPENAI_MODEL_NAME, api_key=openai_api_key_var.get())
+    
+    api_keys = {}
+    serpapi_key = serpapi_key_var.get()
+    if serpapi_key:
+        api_keys["serpapi"] = serpapi_key
+    
+    return llm, EnhancedSearchTool(api_keys)
+
+def agent_llm(llm):
+    """Per-agent copy of a cached LLM client with its own callback list.
+    
+    Every new Agent appends a TokenCalcHandler to its LLM's callbacks, so a
+    shared client would collect handlers (and token counts) from every run.
+    The copy is shallow and still reuses the cached HTTP client. Its calls
+    wait on the pacer of the current session's OpenAI key.
+    """
+    pacer = openai_pacer(key_hash(openai_api_key_var.get()))
+    return llm.copy(update={"callbacks": [_pacing_handler_class()(pacer)]})
+
+# Task prompts are built once at import; only the goal is filled in per request
+GENERATION_TASK = string.Template("""Generate novel research directions for: ${goal}
+
+Steps:
+1. Use the batch_literature_search tool to gather relevant research papers for several queries at once
+2. Analyze current state of research in this area
+3. Identify gaps and opportunities
+4. Generate novel hypotheses and research directions
+5. Provide reasoning for each suggested direction""")
+
+GENERATION_OUTPUT = """- A list of research directions with justification,
+- Supporting literature for each direction,
+- Potential impact and feasibility assessment"""
+
+REFLECTION_TASK = """Analyze and reflect on the generated research directions
+
+Steps:
+1. Review the generated research directions
+2. Use enhanced_literature_search to validate assumptions
+3. Identify potential challenges and limitations
+4. Suggest refinements and improvements
+5. Prioritize the most promising directions"""
+
+REFLECTION_OUTPUT = """- Critical analysis of each research direction,
+- Suggested improvements and refinements,
+- Final prioritized list with recommendations"""
 
 class EnhancedAICoScientist:
     def __init__(self, session_id: str, openai_api_key: str, serpapi_key: str = None):
         """Initialize the Enhanced AI Co-Scientist system with API keys."""
         self.session_id = session_id
-        os.environ['OPENAI_API_KEY'] = openai_api_key
-        
-        api_keys = {}
-        if serpapi_key:
-            api_keys["serpapi"] = serpapi_key
-        
-        self.search_tool = EnhancedSearchTool(api_keys)
-        self.search_tool.session_id = session_id
+        self.openai_api_key = openai_api_key
+        self.serpapi_key = serpapi_key
         
-        # Initialize logs for this session
-        research_logs[session_id] = []
+        # Keeps this session's search rate limits alive while it runs
+        self.rate_state = get_rate_limit_state(session_id)
     
-    def log_activity(self, agent_name: str, action: str, result: str):
+    async def log_activity(self, agent_name: str, action: str, result: str):
         """Log agent activities for monitoring."""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         log_entry = {
-            "timestamp": timestamp,
+            "ts_ns": time.time_ns(),
             "agent": agent_name,
             "action": action,
             "result": result
         }
         
         # Add to session logs
-        if self.session_id in research_logs:
-            research_logs[self.session_id].append(log_entry)
+        await append_session_log(self.session_id, log_entry)
         
-        logger.info(f"{timestamp} - {agent_name}: {action} - {result}")
+        logger.info("%s: %s - %s", agent_name, action, result)
 
-    def create_specialized_agents(self) -> Dict[str, Agent]:
+    @staticmethod
+    def create_specialized_agents(search_tool: EnhancedSearchTool, llm) -> Dict[str, Agent]:
         """Create enhanced specialized agents with additional tools."""
+        from crewai import Agent
+        
         agents = {}
+        batch_search_tool = BatchSearchTool(search_tool)
         
         # Generation Agent
         agents["generation"] = Agent(
@@ -155,8 +721,9 @@ class EnhancedAICoScientist:
             role="Research Generation Specialist",
             goal="Generate novel research directions and hypotheses",
             backstory="""Advanced AI specialized in generating innovative research directions.
-            Use the scientific literature search tool to gather information and generate novel hypotheses.""",
-            tools=[self.search_tool],
+            Use the scientific literature search tools to gather information and generate novel hypotheses.""",
+            tools=[search_tool, batch_search_tool],
+            llm=agent_llm(llm),
             verbose=True,
             allow_delegation=True
         )
@@ -168,140 +735,233 @@ class EnhancedAICoScientist:
             goal="Analyze and reflect on research approaches",
             backstory="""Expert in critical analysis of research methodologies.
             Use the scientific literature search tool to validate and expand upon findings.""",
-            tools=[self.search_tool],
+            tools=[search_tool],
+            llm=agent_llm(llm),
             verbose=True,
             allow_delegation=True
         )
         
         return agents
 
-    def create_supervisor_agent(self) -> Agent:
+    @staticmethod
+    def create_supervisor_agent(llm) -> Agent:
         """Create the supervisor agent that coordinates other agents."""
+        from crewai import Agent
+        
         return Agent(
             name="Supervisor Agent",
             role="Research Coordination Manager",
             goal="Coordinate and manage research agents effectively",
             backstory="""Senior research coordinator responsible for managing specialized research agents.
             Ensures all research directions are properly explored and validated.""",
+            llm=agent_llm(llm),
             verbose=True,
             allow_delegation=True
         )
 
     def create_research_tasks(self, research_goal: str, agents: Dict[str, Agent]) -> List[Task]:
         """Create research tasks based on the provided goal."""
+        from crewai import Task
+        
         tasks = []
         
         # Generation Task
         tasks.append(Task(
-            description=f"""Generate novel research directions for: {research_goal}
-
-Steps:
-1. Use the enhanced_literature_search tool to gather relevant research papers
-2. Analyze current state of research in this area
-3. Identify gaps and opportunities
-4. Generate novel hypotheses and research directions
-5. Provide reasoning for each suggested direction""",
-            expected_output="""- A list of research directions with justification,
-- Supporting literature for each direction,
-- Potential impact and feasibility assessment""",
+            description=GENERATION_TASK.substitute(goal=research_goal),
+            expected_output=GENERATION_OUTPUT,
             agent=agents["generation"]
         ))
         
         # Reflection Task
         tasks.append(Task(
-            description=f"""Analyze and reflect on the generated research directions
-
-Steps:
-1. Review the generated research directions
-2. Use enhanced_literature_search to validate assumptions
-3. Identify potential challenges and limitations
-4. Suggest refinements and improvements
-5. Prioritize the most promising directions""",
-            expected_output="""- Critical analysis of each research direction,
-- Suggested improvements and refinements,
-- Final prioritized list with recommendations""",
+            description=REFLECTION_TASK,
+            expected_output=REFLECTION_OUTPUT,
             agent=agents["reflection"]
         ))
         
         return tasks
 
-    def run_research_process(self, research_goal: str) -> Dict:
-        """Execute the enhanced research process with logging."""
-        agents = self.create_specialized_agents()
-        supervisor = self.create_supervisor_agent()
+    def build_crew(self, research_goal: str):
+        """Assemble this run's crew; reads the API keys from the current context."""
+        from crewai import Crew, Process
+        
+        # Reuse the LLM client and search tool built for these keys, but give
+        # every run its own agents and tasks
+        llm, search_tool = _build_crew_resources(
+            key_hash(self.openai_api_key), key_hash(self.serpapi_key)
+        )
+        agents = self.create_specialized_agents(search_tool, llm)
+        supervisor = self.create_supervisor_agent(llm)
         tasks = self.create_research_tasks(research_goal, agents)
         
-        crew = Crew(
+        return Crew(
             agents=[supervisor] + list(agents.values()),
             tasks=tasks,
             process=Process.sequential,
             verbose=True
         )
+
+    def run_crew(self, research_goal: str):
+        """Build and run the crew; blocks, so it runs on the crew pool."""
+        return self.build_crew(research_goal).kickoff()
+
+    async def run_research_process(self, research_goal: str) -> Dict:
+        """Execute the enhanced research process with logging."""
+        # Scope the shared search tool and API keys to this session; the
+        # crew thread runs inside a copy of this context
+        current_session_id.set(self.session_id)
+        openai_api_key_var.set(self.openai_api_key)
+        serpapi_key_var.set(self.serpapi_key)
         
-        self.log_activity("Supervisor", "Process Started", f"Goal: {research_goal}")
+        await self.log_activity("Supervisor", "Process Started", f"Goal: {research_goal}")
         
         try:
-            result = crew.kickoff()
-            self.log_activity("Supervisor", "Process Completed", "Research results generated")
+            # Building the crew can import crewai and kickoff() blocks on LLM
+            # calls, so keep both off the event loop on the bounded crew pool
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            result = await loop.run_in_executor(EXECUTOR, context.run, self.run_crew, research_goal)
+            await self.log_activity("Supervisor", "Process Completed", "Research results generated")
             return result
         except Exception as e:
             error_msg = f"Error in research process: {str(e)}"
-            self.log_activity("Supervisor", "Process Error", error_msg)
+            await self.log_activity("Supervisor", "Process Error", error_msg)
             raise Exception(error_msg)
 
-def research_worker(session_id, research_goal, openai_api_key, serpapi_key):
-    """Worker function to run research in a separate thread"""
+# Sessions started for each research goal and key pair in the last
+# INFLIGHT_TTL seconds, so identical concurrent requests from the same caller
+# share one crew run instead of paying twice
+INFLIGHT_TTL = 300
+_inflight: Dict[str, str] = {}
+_inflight_lock = threading.Lock()
+
+def inflight_key(research_goal: str, openai_api_key: str, serpapi_key: Optional[str] = None) -> str:
+    """Digest identifying a research goal and its caller's API keys for
+    single-flight deduplication, so a run is never joined on another key"""
+    digest = hashlib.blake2b(research_goal.strip().encode())
+    digest.update(f"\0{key_hash(openai_api_key)}\0{key_hash(serpapi_key)}".encode())
+    return digest.hexdigest()
+
+# Reply to a request that joins an existing session, by the session's status
+JOIN_MESSAGES = {
+    "running": "Joined research process already in progress",
+    "completed": "Research process for this goal already completed",
+    "error": "Research process for this goal failed"
+}
+
+def forget_inflight(goal_key: str, session_id: str):
+    """Stop routing a research goal to a session, unless it was already replaced"""
+    with _inflight_lock:
+        if _inflight.get(goal_key) == session_id:
+            del _inflight[goal_key]
+
+async def research_worker(session_id, research_goal, openai_api_key, serpapi_key):
+    """Worker coroutine that runs research on the background event loop"""
+    # Initialize logs for this session
+    session_logs[session_id] = SessionLog(session_id)
+    
     try:
         # Set process as running
-        research_processes[session_id] = "running"
+        set_session_value(session_id, "status", "running")
         
         # Initialize the scientist
         scientist = EnhancedAICoScientist(session_id, openai_api_key, serpapi_key)
         
         # Run the research process
-        result = scientist.run_research_process(research_goal)
+        result = await scientist.run_research_process(research_goal)
         
         # Store result
-        research_results[session_id] = result
-        research_processes[session_id] = "completed"
+        set_session_value(session_id, "result", result)
+        set_session_value(session_id, "status", "completed")
         
     except Exception as e:
         error_msg = f"Error in research process: {str(e)}"
         logger.error(error_msg)
-        research_results[session_id] = {"error": error_msg}
-        research_processes[session_id] = "error"
+        set_session_value(session_id, "result", {"error": error_msg})
+        set_session_value(session_id, "status", "error")
+        
+        # Let the next request for this goal retry instead of joining a failure
+        forget_inflight(inflight_key(research_goal, openai_api_key, serpapi_key), session_id)
+    
+    finally:
+        # Always hand back the admission slot, even if cleanup fails
+        try:
+            session_log = session_logs.pop(session_id, None)
+            if session_log is not None:
+                session_log.close()
+        finally:
+            _pending_research.release()
+
+def log_worker_failure(future: concurrent.futures.Future):
+    """Surface errors that escaped research_worker's own handling"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Research worker crashed: {future.exception()!r}")
 
 @app.route('/api/start_research', methods=['POST'])
 def start_research():
     """Start a new research process"""
-    data = request.json
+    try:
+        data = orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        data = None
     
     # Validate inputs
-    if not data.get('research_goal'):
-        return jsonify({"status": "error", "message": "Research goal is required"}), 400
+    if not isinstance(data, dict):
+        return jsonify_fast({"status": "error", "message": "Request body must be a JSON object"}, 400)
     
-    if not data.get('openai_api_key'):
-        return jsonify({"status": "error", "message": "OpenAI API key is required"}), 400
+    research_goal = data.get('research_goal')
+    if not isinstance(research_goal, str) or not research_goal.strip():
+        return jsonify_fast({"status": "error", "message": "Research goal is required"}, 400)
     
-    # Generate a session ID
-    session_id = f"research_{int(time.time())}"
+    openai_api_key = data.get('openai_api_key')
+    if not isinstance(openai_api_key, str) or not openai_api_key:
+        return jsonify_fast({"status": "error", "message": "OpenAI API key is required"}, 400)
     
-    # Initialize logs
-    research_logs[session_id] = []
+    serpapi_key = data.get('serpapi_key')
+    if serpapi_key is not None and not isinstance(serpapi_key, str):
+        return jsonify_fast({"status": "error", "message": "SerpAPI key must be a string"}, 400)
     
-    # Start research in a separate thread
-    thread = threading.Thread(
-        target=research_worker,
-        args=(
+    goal_key = inflight_key(research_goal, openai_api_key, serpapi_key)
+    with _inflight_lock:
+        # Join an identical research process instead of starting another
+        session_id = _inflight.get(goal_key)
+        if session_id is not None:
+            process_status = get_session_value(session_id, "status")
+            return jsonify_fast({
+                "status": "success",
+                "session_id": session_id,
+                "message": JOIN_MESSAGES.get(process_status, "Joined existing research process")
+            })
+        
+        # Refuse new work instead of queueing without bound
+        if not _pending_research.acquire(blocking=False):
+            return jsonify_fast({
+                "status": "error",
+                "message": "Too many research processes in progress, please retry shortly"
+            }, 503), {"Retry-After": "30"}
+        
+        # Generate a session ID; random so sessions started in the same
+        # second (on any worker) never share cache keys
+        session_id = f"research_{uuid.uuid4().hex}"
+        
+        # Initialize logs and status
+        set_session_value(session_id, "log_count", 0)
+        set_session_value(session_id, "status", "running")
+        
+        # Schedule research on the background event loop
+        future = run_coroutine(research_worker(
             session_id,
-            data.get('research_goal'),
-            data.get('openai_api_key'),
-            data.get('serpapi_key')
-        )
-    )
-    thread.start()
+            research_goal,
+            openai_api_key,
+            serpapi_key
+        ))
+        future.add_done_callback(log_worker_failure)
+        
+        _inflight[goal_key] = session_id
+        loop = get_research_loop()
+        loop.call_soon_threadsafe(loop.call_later, INFLIGHT_TTL, forget_inflight, goal_key, session_id)
     
-    return jsonify({
+    return jsonify_fast({
         "status": "success",
         "session_id": session_id,
         "message": "Research process started"
@@ -310,35 +970,87 @@ def start_research():
 @app.route('/api/research_status/<session_id>', methods=['GET'])
 def research_status(session_id):
     """Get status of a research process"""
-    if session_id not in research_processes:
-        return jsonify({"status": "error", "message": "Session not found"}), 404
-    
-    # Get logs for this session
-    logs = research_logs.get(session_id, [])
-    
     # Get process status
-    process_status = research_processes.get(session_id, "unknown")
+    process_status = get_session_value(session_id, "status")
+    if process_status is None:
+        return jsonify_fast({"status": "error", "message": "Session not found"}, 404)
+    
+    # Only return logs the client has not seen yet; the buffer keeps the
+    # latest LOG_BUFFER_SIZE entries
+    since = request.args.get("since", 0, type=int)
+    log_count = get_session_value(session_id, "log_count", 0)
+    logs = [format_log_entry(log_entry) for log_entry in get_session_logs(session_id, since, log_count)]
     
     # Get results if available
     result = None
     if process_status == "completed":
-        result = research_results.get(session_id)
+        result = get_session_value(session_id, "result")
     
-    return jsonify({
+    return jsonify_fast({
         "status": "success",
         "process_status": process_status,
         "logs": logs,
+        "log_count": log_count,
         "result": result
     })
 
+@app.route('/api/research_stream/<session_id>', methods=['GET'])
+def research_stream(session_id):
+    """Stream log entries of a research process as Server-Sent Events"""
+    since = request.args.get("since", 0, type=int)
+    if not _open_log_streams.acquire(blocking=False):
+        return jsonify_fast({
+            "status": "error",
+            "message": "Too many open log streams, poll /api/research_status instead"
+        }, 503), {"Retry-After": "30"}
+    
+    queue = run_coroutine(subscribe_session_log(session_id, since)).result()
+    if queue is None:
+        _open_log_streams.release()
+        process_status = get_session_value(session_id, "status")
+        if process_status is None:
+            return jsonify_fast({"status": "error", "message": "Session not found"}, 404)
+        if process_status != "running":
+            # Already finished; the full logs and result are in research_status
+            end_event = orjson.dumps({"process_status": process_status}).decode()
+            return Response(f"event: end\ndata: {end_event}\n\n", mimetype="text/event-stream")
+        return jsonify_fast({"status": "error", "message": "Session is not running on this worker"}, 404)
+    
+    def generate():
+        while True:
+            log_entry = run_coroutine(next_log_entry(queue, SSE_KEEPALIVE)).result()
+            if log_entry is None:
+                yield "event: end\ndata: {}\n\n"
+                break
+            if not log_entry:
+                yield ": keepalive\n\n"
+                continue
+            yield f"data: {orjson.dumps(format_log_entry(log_entry), default=str).decode()}\n\n"
+    
+    def close_stream():
+        get_research_loop().call_soon_threadsafe(unsubscribe_session_log, session_id, queue)
+        _open_log_streams.release()
+    
+    response = Response(generate(), mimetype="text/event-stream")
+    # Runs when the server closes the response, even if the client
+    # disconnected before the generator started
+    response.call_on_close(close_stream)
+    return response
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """API health check endpoint"""
-    return jsonify({"status": "healthy"})
+    return jsonify_fast({"status": "healthy"})
 
 # Entry point for serverless functions
 def handler(request):
     return app(request)
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
+    # Werkzeug's dev server is for local development only; production runs
+    # under gunicorn (see Procfile)
+    if os.environ.get("FLASK_DEV"):
+        app.run(host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
+    else:
+        logger.error("Set FLASK_DEV=1 to use the development server, or run: "
+                     "gunicorn --preload -k gthread app:app")
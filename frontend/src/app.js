@@ -115,12 +115,20 @@ function App() {
       clearInterval(statusPolling);
     }
     
+    // Only new log entries are returned after the first poll
+    let logCount = 0;
+    setLogs([]);
+    
     const interval = setInterval(async () => {
       try {
-        const response = await axios.get(`${API_BASE_URL}/research_status/${sid}`);
+        const response = await axios.get(`${API_BASE_URL}/research_status/${sid}`, {
+          params: { since: logCount },
+        });
         
         if (response.data.status === 'success') {
-          setLogs(response.data.logs || []);
+          const newLogs = response.data.logs || [];
+          logCount = response.data.log_count ?? logCount + newLogs.length;
+          setLogs(prevLogs => [...prevLogs, ...newLogs]);
           
           if (response.data.process_status === 'completed') {
             setStatus('completed');